@@ -2,11 +2,35 @@
 Command Line Interface for managing the Telegram bot
 """
 
-import json
+import os
 import sys
+import time
 import logging
-from datetime import datetime
-from pathlib import Path
+from config import TIME_FORMAT_RE
+from utils import json_loads, json_dumps, atomic_write
+
+# Main menu, printed as one block
+MAIN_MENU_LINES = (
+    "\n" + "=" * 50,
+    "📋 MAIN MENU",
+    "=" * 50,
+    "1. 📝 List daily messages",
+    "2. ➕ Add new message",
+    "3. ✏️  Edit message",
+    "4. 🗑️  Delete message",
+    "5. ⚙️  Show configuration",
+    "6. 🔧 Edit configuration",
+    "7. 🧪 Test bot connection",
+    "8. 🚪 Exit"
+)
+
+# Accepted answers for confirmation and boolean prompts
+_YES = frozenset({'y', 'yes'})
+_BOOL = frozenset({'true', 'false'})
+
+def _now_iso():
+    """Current local time as an ISO 8601 string, to the second"""
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
 
 class CLI:
     def __init__(self, config):
@@ -14,15 +38,17 @@ class CLI:
         self.logger = logging.getLogger(__name__)
         self.messages_file = 'messages.json'
         
-        # Ensure messages file exists
+        # Messages are kept in memory and written back only when changed
+        self._data = None
+        self._dirty = False
+        
+        # Ensure messages file exists and load it
         self._ensure_messages_file()
     
     def _ensure_messages_file(self):
-        """Ensure messages.json file exists with default structure"""
-        messages_path = Path(self.messages_file)
-        
-        if not messages_path.exists():
-            default_data = {
+        """Ensure messages.json file exists with default structure and load it"""
+        if not os.path.exists(self.messages_file):
+            self._data = {
                 "daily_messages": [
                     "🌅 Good morning! Have a wonderful day ahead!",
                     "💪 Stay strong and keep pushing forward!",
@@ -30,17 +56,45 @@ class CLI:
                     "🎯 Focus on your goals and make today count!",
                     "✨ Every day is a new opportunity to shine!"
                 ],
-                "created_at": datetime.now().isoformat(),
-                "last_modified": datetime.now().isoformat()
+                "created_at": _now_iso()
             }
+            self._dirty = True
             
             try:
-                with open(self.messages_file, 'w') as f:
-                    json.dump(default_data, f, indent=2)
+                self._save()
                 print(f"Created default messages file: {self.messages_file}")
             except Exception as e:
+                # Message commands report the problem again; config and testing still work
                 print(f"Error creating messages file: {e}")
-                sys.exit(1)
+            return
+        
+        try:
+            self._load_data()
+        except Exception as e:
+            print(f"Error reading messages file: {e}")
+    
+    def _load_data(self):
+        """Return the messages data, parsing messages.json only on first use"""
+        if self._data is None:
+            with open(self.messages_file, 'rb') as f:
+                self._data = json_loads(f.read())
+        return self._data
+    
+    def _save(self):
+        """Write messages to disk if they changed since the last save"""
+        if not self._dirty:
+            return
+        
+        try:
+            self._data['last_modified'] = _now_iso()
+            atomic_write(self.messages_file, json_dumps(self._data))
+        except Exception:
+            # Drop the unsaved change so a reported failure is never written later;
+            # the next command reloads the file from disk
+            self._data = None
+            raise
+        finally:
+            self._dirty = False
     
     def run(self):
         """Run the CLI interface"""
@@ -67,6 +121,10 @@ class CLI:
             elif choice == '7':
                 self._test_bot()
             elif choice == '8':
+                try:
+                    self._save()
+                except Exception as e:
+                    print(f"❌ Error saving messages: {e}")
                 print("Goodbye! 👋")
                 break
             else:
@@ -74,39 +132,31 @@ class CLI:
             
             input("\nPress Enter to continue...")
     
+    def _write_screen(self, lines):
+        """Print a block of lines with a single write"""
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+    
     def _show_menu(self):
         """Display the main menu"""
-        print("\n" + "=" * 50)
-        print("📋 MAIN MENU")
-        print("=" * 50)
-        print("1. 📝 List daily messages")
-        print("2. ➕ Add new message")
-        print("3. ✏️  Edit message")
-        print("4. 🗑️  Delete message")
-        print("5. ⚙️  Show configuration")
-        print("6. 🔧 Edit configuration")
-        print("7. 🧪 Test bot connection")
-        print("8. 🚪 Exit")
+        self._write_screen(MAIN_MENU_LINES)
     
-    def _list_messages(self):
+    def _list_messages(self, data=None):
         """List all daily messages"""
         try:
-            with open(self.messages_file, 'r') as f:
-                data = json.load(f)
-            
+            if data is None:
+                data = self._load_data()
             messages = data.get('daily_messages', [])
             
-            print("\n📝 DAILY MESSAGES")
-            print("-" * 30)
+            lines = ["\n📝 DAILY MESSAGES", "-" * 30]
             
             if not messages:
-                print("No messages configured.")
-                return
-            
-            for i, message in enumerate(messages, 1):
-                print(f"{i}. {message}")
+                lines.append("No messages configured.")
+            else:
+                lines.extend(f"{i}. {message}" for i, message in enumerate(messages, 1))
+                lines.append(f"\nTotal messages: {len(messages)}")
             
-            print(f"\nTotal messages: {len(messages)}")
+            self._write_screen(lines)
             
         except Exception as e:
             print(f"❌ Error reading messages: {e}")
@@ -123,14 +173,9 @@ class CLI:
             return
         
         try:
-            with open(self.messages_file, 'r') as f:
-                data = json.load(f)
-            
-            data['daily_messages'].append(message)
-            data['last_modified'] = datetime.now().isoformat()
-            
-            with open(self.messages_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            self._load_data()['daily_messages'].append(message)
+            self._dirty = True
+            self._save()
             
             print("✅ Message added successfully!")
             
@@ -139,12 +184,9 @@ class CLI:
     
     def _edit_message(self):
         """Edit an existing message"""
-        self._list_messages()
-        
         try:
-            with open(self.messages_file, 'r') as f:
-                data = json.load(f)
-            
+            data = self._load_data()
+            self._list_messages(data)
             messages = data.get('daily_messages', [])
             
             if not messages:
@@ -172,10 +214,8 @@ class CLI:
             
             if new_message:
                 messages[index] = new_message
-                data['last_modified'] = datetime.now().isoformat()
-                
-                with open(self.messages_file, 'w') as f:
-                    json.dump(data, f, indent=2)
+                self._dirty = True
+                self._save()
                 
                 print("✅ Message updated successfully!")
             else:
@@ -186,12 +226,9 @@ class CLI:
     
     def _delete_message(self):
         """Delete a message"""
-        self._list_messages()
-        
         try:
-            with open(self.messages_file, 'r') as f:
-                data = json.load(f)
-            
+            data = self._load_data()
+            self._list_messages(data)
             messages = data.get('daily_messages', [])
             
             if not messages:
@@ -217,12 +254,10 @@ class CLI:
             
             confirm = input("Are you sure? (y/N): ").strip().lower()
             
-            if confirm in ['y', 'yes']:
+            if confirm in _YES:
                 messages.pop(index)
-                data['last_modified'] = datetime.now().isoformat()
-                
-                with open(self.messages_file, 'w') as f:
-                    json.dump(data, f, indent=2)
+                self._dirty = True
+                self._save()
                 
                 print("✅ Message deleted successfully!")
             else:
@@ -233,16 +268,18 @@ class CLI:
     
     def _show_config(self):
         """Show current configuration"""
-        print("\n⚙️ CURRENT CONFIGURATION")
-        print("-" * 25)
-        print(f"Bot Token: {'*' * 20}...{self.config.bot_token[-4:] if len(self.config.bot_token) > 4 else '(not set)'}")
-        print(f"Chat ID: {self.config.chat_id}")
-        print(f"Schedule Time: {self.config.schedule_time}")
-        print(f"Timezone: {self.config.timezone}")
-        print(f"Log Level: {self.config.log_level}")
-        print(f"Include Date: {self.config.include_date}")
-        print(f"Retry Attempts: {self.config.retry_attempts}")
-        print(f"Retry Delay: {self.config.retry_delay}s")
+        self._write_screen([
+            "\n⚙️ CURRENT CONFIGURATION",
+            "-" * 25,
+            f"Bot Token: {'*' * 20}...{self.config.bot_token[-4:] if len(self.config.bot_token) > 4 else '(not set)'}",
+            f"Chat ID: {self.config.chat_id}",
+            f"Schedule Time: {self.config.schedule_time}",
+            f"Timezone: {self.config.timezone}",
+            f"Log Level: {self.config.log_level}",
+            f"Include Date: {self.config.include_date}",
+            f"Retry Attempts: {self.config.retry_attempts}",
+            f"Retry Delay: {self.config.retry_delay}s"
+        ])
     
     def _edit_config(self):
         """Edit configuration"""
@@ -255,16 +292,10 @@ class CLI:
         current_time = self.config.schedule_time
         new_time = input(f"Schedule time ({current_time}): ").strip()
         if new_time:
-            try:
-                # Validate time format
-                time_parts = new_time.split(':')
-                if len(time_parts) != 2:
-                    raise ValueError
-                hour, minute = int(time_parts[0]), int(time_parts[1])
-                if not (0 <= hour <= 23 and 0 <= minute <= 59):
-                    raise ValueError
+            # Validate time format
+            if TIME_FORMAT_RE.fullmatch(new_time):
                 self.config.schedule_time = new_time
-            except ValueError:
+            else:
                 print("❌ Invalid time format. Keeping current value.")
         
         # Chat ID
@@ -276,7 +307,7 @@ class CLI:
         # Include date
         current_date = str(self.config.include_date)
         new_date = input(f"Include date in messages ({current_date}) [true/false]: ").strip().lower()
-        if new_date in ['true', 'false']:
+        if new_date in _BOOL:
             self.config.include_date = new_date == 'true'
         
         try:
@@ -299,7 +330,7 @@ class CLI:
                 
                 # Send test message
                 send_test = input("Send test message? (y/N): ").strip().lower()
-                if send_test in ['y', 'yes']:
+                if send_test in _YES:
                     test_msg = "🧪 This is a test message from CLI interface!"
                     bot.send_message(test_msg)
                     print("✅ Test message sent!")
@@ -2,10 +2,66 @@
 Configuration management for Telegram Daily Message Bot
 """
 
-import configparser
 import os
+import re
 import logging
-from pathlib import Path
+from utils import atomic_write
+
+# Schedule time in 24-hour HH:MM format
+TIME_FORMAT_RE = re.compile(r'([01]\d|2[0-3]):[0-5]\d')
+
+# Layout of the configuration file, written in a single pass
+CONFIG_TEMPLATE = """[TELEGRAM]
+bot_token = {bot_token}
+chat_id = {chat_id}
+
+[SCHEDULE]
+time = {schedule_time}
+timezone = {timezone}
+
+[APPLICATION]
+log_level = {log_level}
+include_date = {include_date}
+retry_attempts = {retry_attempts}
+retry_delay = {retry_delay}
+
+"""
+
+# Accepted boolean spellings, as in configparser
+_BOOLEAN_STATES = {
+    '1': True, 'yes': True, 'true': True, 'on': True,
+    '0': False, 'no': False, 'false': False, 'off': False
+}
+
+def _parse_ini(text):
+    """Parse INI text into {section: {key: value}}"""
+    sections = {}
+    current = None
+    
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+        
+        if line[0] == '[' and line[-1] == ']':
+            current = sections.setdefault(line[1:-1].strip(), {})
+            continue
+        
+        delimiters = [i for i in (line.find('='), line.find(':')) if i != -1]
+        if current is None or not delimiters:
+            raise ValueError(f"Invalid configuration line: {line}")
+        
+        split_at = min(delimiters)
+        current[line[:split_at].strip().lower()] = line[split_at + 1:].strip()
+    
+    return sections
+
+def _parse_bool(value):
+    """Parse a boolean configuration value"""
+    try:
+        return _BOOLEAN_STATES[value.lower()]
+    except KeyError:
+        raise ValueError(f"Not a boolean: {value}")
 
 class Config:
     def __init__(self, config_file='config.ini'):
@@ -22,37 +78,44 @@ class Config:
         self.retry_attempts = 3
         self.retry_delay = 60
         
+        # Raw values from the configuration file, by section
+        self._raw = {}
+        
+        # Validation errors and the values they were computed for
+        self._validation_errors = []
+        self._validated_for = None
+        
         self._load_config()
+        self._run_validation()
     
     def _load_config(self):
         """Load configuration from file"""
-        config_path = Path(self.config_file)
-        
-        if not config_path.exists():
+        if not os.path.exists(self.config_file):
             self.logger.info(f"Config file {self.config_file} not found, creating default")
             self._create_default_config()
             return
         
         try:
-            config = configparser.ConfigParser()
-            config.read(self.config_file)
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                self._raw = _parse_ini(f.read())
             
             # Telegram settings
-            telegram_section = config['TELEGRAM']
+            telegram_section = self._raw['TELEGRAM']
             self.bot_token = telegram_section.get('bot_token', self.bot_token)
             self.chat_id = telegram_section.get('chat_id', self.chat_id)
             
             # Schedule settings
-            schedule_section = config['SCHEDULE']
+            schedule_section = self._raw['SCHEDULE']
             self.schedule_time = schedule_section.get('time', self.schedule_time)
             self.timezone = schedule_section.get('timezone', self.timezone)
             
             # Application settings
-            app_section = config['APPLICATION']
+            app_section = self._raw['APPLICATION']
             self.log_level = app_section.get('log_level', self.log_level)
-            self.include_date = app_section.getboolean('include_date', self.include_date)
-            self.retry_attempts = app_section.getint('retry_attempts', self.retry_attempts)
-            self.retry_delay = app_section.getint('retry_delay', self.retry_delay)
+            if 'include_date' in app_section:
+                self.include_date = _parse_bool(app_section['include_date'])
+            self.retry_attempts = int(app_section.get('retry_attempts', self.retry_attempts))
+            self.retry_delay = int(app_section.get('retry_delay', self.retry_delay))
             
             self.logger.info("Configuration loaded successfully")
             
@@ -62,64 +125,55 @@ class Config:
     
     def _create_default_config(self):
         """Create default configuration file"""
-        config = configparser.ConfigParser()
-        
-        config['TELEGRAM'] = {
-            'bot_token': '# Get from @BotFather on Telegram',
-            'chat_id': '# Your Telegram chat ID'
-        }
-        
-        config['SCHEDULE'] = {
-            'time': '09:00',
-            'timezone': 'UTC'
-        }
-        
-        config['APPLICATION'] = {
-            'log_level': 'INFO',
-            'include_date': 'true',
-            'retry_attempts': '3',
-            'retry_delay': '60'
-        }
+        payload = CONFIG_TEMPLATE.format(
+            bot_token='# Get from @BotFather on Telegram',
+            chat_id='# Your Telegram chat ID',
+            schedule_time='09:00',
+            timezone='UTC',
+            log_level='INFO',
+            include_date='true',
+            retry_attempts='3',
+            retry_delay='60'
+        )
         
         try:
-            with open(self.config_file, 'w') as f:
-                config.write(f)
+            self._write_config(payload)
             self.logger.info(f"Default configuration created at {self.config_file}")
         except Exception as e:
             self.logger.error(f"Failed to create default configuration: {e}")
             raise
     
+    def _write_config(self, payload):
+        """Write the rendered configuration in one write and swap it into place"""
+        # New config files hold the bot token, so they start private
+        atomic_write(self.config_file, payload.encode('utf-8'), mode=0o600)
+    
     def save(self):
         """Save current configuration to file"""
-        config = configparser.ConfigParser()
-        
-        config['TELEGRAM'] = {
-            'bot_token': self.bot_token,
-            'chat_id': self.chat_id
-        }
-        
-        config['SCHEDULE'] = {
-            'time': self.schedule_time,
-            'timezone': self.timezone
-        }
-        
-        config['APPLICATION'] = {
-            'log_level': self.log_level,
-            'include_date': str(self.include_date).lower(),
-            'retry_attempts': str(self.retry_attempts),
-            'retry_delay': str(self.retry_delay)
-        }
+        payload = CONFIG_TEMPLATE.format(
+            bot_token=self.bot_token,
+            chat_id=self.chat_id,
+            schedule_time=self.schedule_time,
+            timezone=self.timezone,
+            log_level=self.log_level,
+            include_date=str(self.include_date).lower(),
+            retry_attempts=self.retry_attempts,
+            retry_delay=self.retry_delay
+        )
         
         try:
-            with open(self.config_file, 'w') as f:
-                config.write(f)
+            self._write_config(payload)
             self.logger.info("Configuration saved successfully")
         except Exception as e:
             self.logger.error(f"Failed to save configuration: {e}")
             raise
     
-    def validate(self):
-        """Validate configuration values"""
+    def _validated_values(self):
+        """Values that validation depends on, used to detect changes since the last run"""
+        return (self.bot_token, self.chat_id, self.schedule_time, self.retry_attempts, self.retry_delay)
+    
+    def _run_validation(self):
+        """Validate configuration values and cache the errors"""
         errors = []
         
         # Check required fields
@@ -130,14 +184,7 @@ class Config:
             errors.append("Chat ID is required")
         
         # Validate schedule time format
-        try:
-            time_parts = self.schedule_time.split(':')
-            if len(time_parts) != 2:
-                raise ValueError
-            hour, minute = int(time_parts[0]), int(time_parts[1])
-            if not (0 <= hour <= 23 and 0 <= minute <= 59):
-                raise ValueError
-        except ValueError:
+        if not TIME_FORMAT_RE.fullmatch(self.schedule_time):
             errors.append("Schedule time must be in HH:MM format (24-hour)")
         
         # Validate numeric values
@@ -147,7 +194,16 @@ class Config:
         if self.retry_delay < 0:
             errors.append("Retry delay must be non-negative")
         
-        if errors:
-            raise ValueError("Configuration validation failed: " + "; ".join(errors))
+        self._validation_errors = errors
+        self._validated_for = self._validated_values()
+    
+    def validate(self):
+        """Validate configuration values"""
+        # Reuse the errors found at load time unless a value has changed since
+        if self._validated_for != self._validated_values():
+            self._run_validation()
+        
+        if self._validation_errors:
+            raise ValueError("Configuration validation failed: " + "; ".join(self._validation_errors))
         
         return True
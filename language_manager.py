@@ -2,91 +2,134 @@
 Language Manager for multi-language support
 """
 
-import json
 import logging
+import functools
+import random
+import re
+import threading
 from pathlib import Path
+from utils import json_loads
+
+# English habit recognition patterns (default)
+_EN_HABIT_PATTERNS = (
+    "i did it", "did it", "slipped up", "had the habit", 
+    "relapsed", "fell back", "messed up", "gave in",
+    "happened again", "went back to it", "did the thing",
+    "broke my streak", "couldn't resist", "lost control"
+)
 
 class LanguageManager:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        
+        # Language files are parsed on first use of each language
+        self._language_paths = {'english': 'english.json', 'arabic': 'arabic.json'}
         self.languages = {}
-        self.load_languages()
+        
+        # Texts per loaded language, flattened to {(category, key): text}
+        self._flat = {}
+        
+        # Habit patterns per language; English uses the built-in list, other
+        # languages take theirs from their language file when it loads
+        self._patterns = {'english': _EN_HABIT_PATTERNS}
+        
+        # Habit patterns compiled into a single alternation per loaded language
+        self._habit_re = {}
+        
+        # Serializes first loads; re-entrant because a failed load falls back to English
+        self._load_lock = threading.RLock()
+        
+        # Memoized raw text lookups, keyed by language, category and key
+        self._cached_lookup = functools.lru_cache(maxsize=512)(self._lookup_text)
     
     def load_languages(self):
-        """Load language files"""
-        try:
-            # Load English
-            with open('english.json', 'r', encoding='utf-8') as f:
-                self.languages['english'] = json.load(f)
+        """Load all language files"""
+        for language in list(self._language_paths):
+            self._ensure_loaded(language)
+    
+    def _ensure_loaded(self, language):
+        """Load a language file on first use and return the language to use"""
+        # Default to English if language not found
+        if language not in self._language_paths:
+            language = 'english'
+        
+        if language in self.languages:
+            return language
+        
+        with self._load_lock:
+            if language in self.languages:
+                return language
             
-            # Load Arabic
-            with open('arabic.json', 'r', encoding='utf-8') as f:
-                self.languages['arabic'] = json.load(f)
+            try:
+                with open(self._language_paths[language], 'rb') as f:
+                    data = json_loads(f.read())
+                data['daily_messages'] = tuple(data.get('daily_messages', ()))
+                self.logger.info(f"Language file for {language} loaded successfully")
+            except Exception as e:
+                self.logger.error(f"Failed to load language file for {language}: {e}")
+                if language != 'english':
+                    # Serve this language in English from now on
+                    self._language_paths.pop(language, None)
+                    return self._ensure_loaded('english')
+                
+                # Fallback to basic English
+                data = {
+                    "commands": {"welcome": "Welcome! Language files not found."},
+                    "general": {"error": "Error loading languages"}
+                }
             
-            self.logger.info("Language files loaded successfully")
-        except Exception as e:
-            self.logger.error(f"Failed to load language files: {e}")
-            # Fallback to basic English
-            self.languages['english'] = {
-                "commands": {"welcome": "Welcome! Language files not found."},
-                "general": {"error": "Error loading languages"}
+            self._flat[language] = {
+                (category, key): text
+                for category, entries in data.items() if isinstance(entries, dict)
+                for key, text in entries.items()
             }
+            self._patterns.setdefault(language, tuple(data.get('habit_patterns', ())))
+            self._habit_re[language] = self._compile_habit_patterns(self._patterns[language])
+            
+            # Publish last: the unlocked check above treats this as "fully loaded"
+            self.languages[language] = data
+        return language
     
     def get_text(self, language, category, key, **kwargs):
         """Get text for specific language, category and key"""
-        try:
-            # Default to English if language not found
-            if language not in self.languages:
-                language = 'english'
-            
-            # Get the text
-            text = self.languages[language].get(category, {}).get(key, "Text not found")
-            
-            # Format with provided arguments
-            if kwargs:
+        text = self._cached_lookup(language, category, key)
+        
+        # Format with provided arguments
+        if kwargs:
+            try:
                 text = text.format(**kwargs)
-            
-            return text
-        except Exception as e:
-            self.logger.error(f"Failed to get text: {e}")
-            return "Error loading text"
+            except (KeyError, IndexError, ValueError) as e:
+                self.logger.error(f"Failed to format text: {e}")
+                return "Error loading text"
+        
+        return text
+    
+    def _lookup_text(self, language, category, key):
+        """Resolve unformatted text (wrapped by the LRU cache in __init__)"""
+        language = self._ensure_loaded(language)
+        return self._flat[language].get((category, key), "Text not found")
     
     def get_daily_message(self, language):
         """Get a random daily message"""
-        try:
-            import random
-            if language not in self.languages:
-                language = 'english'
-            
-            messages = self.languages[language].get('daily_messages', ['Stay mindful today!'])
-            return random.choice(messages)
-        except Exception as e:
-            self.logger.error(f"Failed to get daily message: {e}")
+        language = self._ensure_loaded(language)
+        messages = self.languages[language].get('daily_messages')
+        if not messages:
             return "Stay mindful today!"
+        return random.choice(messages)
     
     def get_habit_patterns(self, language):
         """Get habit recognition patterns for a language"""
-        try:
-            if language == 'arabic':
-                return self.languages['arabic'].get('habit_patterns', [])
-            else:
-                # English patterns (default)
-                return [
-                    "i did it", "did it", "slipped up", "had the habit", 
-                    "relapsed", "fell back", "messed up", "gave in",
-                    "happened again", "went back to it", "did the thing",
-                    "broke my streak", "couldn't resist", "lost control"
-                ]
-        except Exception as e:
-            self.logger.error(f"Failed to get habit patterns: {e}")
-            return ["did it", "slipped up"]
+        return self._patterns[self._ensure_loaded(language)]
+    
+    @staticmethod
+    def _compile_habit_patterns(patterns):
+        """Compile habit patterns into one case-insensitive regex"""
+        if not patterns:
+            # Never matches, same as scanning an empty pattern list
+            return re.compile(r'(?!)')
+        return re.compile('|'.join(map(re.escape, patterns)), re.IGNORECASE)
     
     def is_habit_message(self, text, language):
         """Check if a message indicates a habit occurrence"""
-        try:
-            patterns = self.get_habit_patterns(language)
-            text_lower = text.lower()
-            return any(pattern in text_lower for pattern in patterns)
-        except Exception as e:
-            self.logger.error(f"Failed to check habit message: {e}")
-            return False
\ No newline at end of file
+        language = self._ensure_loaded(language)
+        return self._habit_re[language].search(text) is not None
\ No newline at end of file
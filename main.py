@@ -9,9 +9,6 @@ import logging
 import signal
 import time
 from config import Config
-from bot import TelegramBot
-from scheduler import MessageScheduler
-from cli import CLI
 
 def setup_logging(config):
     """Setup logging configuration"""
@@ -63,7 +60,8 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
     
     if args.cli:
-        # Run CLI interface
+        # Run CLI interface (imported here so CLI mode skips the bot and scheduler imports)
+        from cli import CLI
         cli = CLI(config)
         cli.run()
     else:
@@ -71,9 +69,13 @@ def main():
         logger.info("Starting Telegram Daily Message Bot")
         
         try:
+            from bot import TelegramBot
+            from scheduler import MessageScheduler
+            
             # Initialize bot
             bot = TelegramBot(config)
             scheduler = MessageScheduler(bot, config)
+            bot.scheduler = scheduler
             
             # Test bot connection
             if not bot.test_connection():
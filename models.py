@@ -3,61 +3,216 @@ Database models for habit tracking
 """
 
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from psycopg2.extensions import cursor as TupleCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from datetime import datetime, date
 import logging
 
+# Bump whenever _create_tables changes so existing databases get migrated
+SCHEMA_VERSION = 'habit-tracker schema 4'
+
+DB_POOL_MIN = 2
+DB_POOL_MAX = 10
+INSERT_PAGE_SIZE = 1000
+# Fail fast on dead sockets and stuck queries instead of hanging the caller
+DB_CONNECT_OPTIONS = {
+    'connect_timeout': 10,
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+    'tcp_user_timeout': 30000,
+    'options': '-c statement_timeout=5000 -c idle_in_transaction_session_timeout=10000',
+}
+LANGUAGE_CACHE_TTL = 300
+LANGUAGE_CACHE_MAX = 10000
+
+# Parsed and planned once per pooled connection, then run with EXECUTE
+PREPARED_STATEMENTS = {
+    'habit_add_entry': """
+        WITH ins AS (
+            INSERT INTO habit_entries (user_id, notes)
+            VALUES ($1, $2)
+            RETURNING entry_date
+        ), cnt AS (
+            INSERT INTO users (user_id, total_count, last_entry_date)
+            SELECT $1, 1, entry_date FROM ins
+            ON CONFLICT (user_id)
+            DO UPDATE SET
+                total_count = users.total_count + 1,
+                last_entry_date = GREATEST(users.last_entry_date, EXCLUDED.last_entry_date),
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING total_count
+        )
+        SELECT ins.entry_date, cnt.total_count
+        FROM ins, cnt
+    """,
+    'habit_last_entry': """
+        SELECT entry_date, created_at, notes
+        FROM habit_entries
+        WHERE user_id = $1
+        ORDER BY entry_date DESC, created_at DESC
+        LIMIT 1
+    """,
+    'habit_total_count': """
+        SELECT total_count FROM users WHERE user_id = $1
+    """,
+    'habit_days_since_last': """
+        SELECT CURRENT_DATE - last_entry_date AS days_since_last
+        FROM users
+        WHERE user_id = $1
+    """,
+    'habit_user_stats': """
+        SELECT total_count, last_entry_date,
+               CURRENT_DATE - last_entry_date AS days_since_last
+        FROM users
+        WHERE user_id = $1
+    """,
+    'habit_get_language': """
+        WITH ins AS (
+            INSERT INTO users (user_id, language)
+            VALUES ($1, 'english')
+            ON CONFLICT (user_id) DO NOTHING
+            RETURNING language
+        )
+        SELECT language FROM ins
+        UNION ALL
+        SELECT language FROM users WHERE user_id = $1
+        LIMIT 1
+    """,
+    'habit_set_language': """
+        INSERT INTO users (user_id, language)
+        VALUES ($1, $2)
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            language = EXCLUDED.language,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING language
+    """,
+    'habit_claim_daily_run': """
+        INSERT INTO daily_runs (run_date, chat_id)
+        VALUES ($1, $2)
+        ON CONFLICT (run_date, chat_id) DO NOTHING
+        RETURNING run_date
+    """,
+}
+
 class HabitTracker:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.connection = None
+        self.pool = None
+        # getconn() raises instead of blocking when the pool is exhausted
+        self._pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+        self._prepared = weakref.WeakSet()
+        self._lang_cache = {}
         self._connect()
         self._create_tables()
     
     def _connect(self):
-        """Connect to PostgreSQL database"""
+        """Create the PostgreSQL connection pool"""
         try:
             database_url = os.getenv('DATABASE_URL')
             if not database_url:
                 raise ValueError("DATABASE_URL environment variable is required")
             
-            self.connection = psycopg2.connect(
+            self.pool = ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
                 database_url,
-                cursor_factory=RealDictCursor
+                cursor_factory=RealDictCursor,
+                **DB_CONNECT_OPTIONS
             )
             self.logger.info("Connected to database successfully")
         except Exception as e:
             self.logger.error(f"Database connection failed: {e}")
             raise
     
-    def _ensure_connection(self):
-        """Ensure database connection is alive, reconnect if needed"""
-        try:
-            if not self.connection or self.connection.closed:
-                self.logger.info("Database connection lost, reconnecting...")
-                self._connect()
-            else:
-                # Test the connection
-                with self.connection.cursor() as cursor:
-                    cursor.execute('SELECT 1')
-        except Exception as e:
-            self.logger.warning(f"Connection test failed, reconnecting: {e}")
+    def _checkout(self):
+        """Take a connection from the pool, replacing it if it has been closed"""
+        connection = self.pool.getconn()
+        if connection.closed:
+            self.logger.info("Database connection lost, reconnecting...")
+            self.pool.putconn(connection, close=True)
+            connection = self.pool.getconn()
+        return connection
+    
+    def _prepare(self, connection):
+        """Register the prepared statements on a fresh connection"""
+        with connection.cursor() as cursor:
+            # PREPARE survives ROLLBACK, so clear leftovers of an earlier failed attempt
+            cursor.execute("DEALLOCATE ALL")
+            for name, query in PREPARED_STATEMENTS.items():
+                cursor.execute(f"PREPARE {name} AS {query}")
+        connection.commit()
+        self._prepared.add(connection)
+    
+    @contextmanager
+    def _conn(self, prepare=True):
+        """Borrow a pooled connection for the duration of the block"""
+        with self._pool_slots:
+            connection = self._checkout()
+            discard = False
             try:
-                self._connect()
-            except Exception as reconnect_error:
-                self.logger.error(f"Failed to reconnect: {reconnect_error}")
+                if prepare and connection not in self._prepared:
+                    try:
+                        self._prepare(connection)
+                    except Exception:
+                        # Partly prepared sessions are not reused
+                        discard = True
+                        raise
+                yield connection
+            except Exception:
+                try:
+                    if not connection.closed:
+                        connection.rollback()
+                except:
+                    pass
                 raise
+            finally:
+                self.pool.putconn(connection, close=discard or bool(connection.closed))
+    
+    @staticmethod
+    def _schema_is_current(cursor):
+        """Check the schema version tag on habit_entries (NULL if the table is missing)"""
+        cursor.execute("SELECT obj_description(to_regclass('habit_entries'), 'pg_class')")
+        return cursor.fetchone()[0] == SCHEMA_VERSION
     
     def _create_tables(self):
         """Create habit entries and users tables if they don't exist"""
         try:
-            if self.connection:
-                with self.connection.cursor() as cursor:
+            with self._conn(prepare=False) as conn:
+                with conn.cursor(cursor_factory=TupleCursor) as cursor:
+                    # Hot restarts find the schema already current and skip the DDL locks
+                    if self._schema_is_current(cursor):
+                        conn.commit()
+                        self.logger.info("Database schema is up to date")
+                        return
+                    
+                    # Waiting for the lock and the backfills may both outlast the
+                    # per-statement timeout; set it on its own so it covers both
+                    cursor.execute("SET LOCAL statement_timeout = 0")
+                    
+                    # Replicas starting together migrate one at a time
+                    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('habit_tracker_schema'))")
+                    
+                    # The replica that held the lock may have just migrated
+                    if self._schema_is_current(cursor):
+                        conn.commit()
+                        self.logger.info("Database schema is up to date")
+                        return
+                    
                     cursor.execute("""
                         CREATE TABLE IF NOT EXISTS users (
                             user_id BIGINT PRIMARY KEY,
                             language VARCHAR(10) DEFAULT 'english',
+                            total_count INTEGER NOT NULL DEFAULT 0,
+                            last_entry_date DATE,
                             created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
                             updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
                         );
@@ -70,55 +225,148 @@ class HabitTracker:
                             notes TEXT
                         );
                         
-                        CREATE INDEX IF NOT EXISTS idx_habit_entries_user_date 
-                        ON habit_entries(user_id, entry_date);
+                        CREATE TABLE IF NOT EXISTS daily_runs (
+                            run_date DATE NOT NULL,
+                            chat_id TEXT NOT NULL,
+                            claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                            PRIMARY KEY (run_date, chat_id)
+                        );
+                        
+                        -- Claims used to be per date only; key them per chat as well
+                        DO $$
+                        BEGIN
+                            IF NOT EXISTS (
+                                SELECT 1 FROM information_schema.columns
+                                WHERE table_schema = current_schema()
+                                  AND table_name = 'daily_runs' AND column_name = 'chat_id'
+                            ) THEN
+                                ALTER TABLE daily_runs ADD COLUMN chat_id TEXT NOT NULL DEFAULT '';
+                                ALTER TABLE daily_runs ALTER COLUMN chat_id DROP DEFAULT;
+                                ALTER TABLE daily_runs DROP CONSTRAINT daily_runs_pkey;
+                                ALTER TABLE daily_runs ADD PRIMARY KEY (run_date, chat_id);
+                            END IF;
+                        END $$;
+                        
+                        -- Older databases predate the rolling count: add and backfill it once
+                        DO $$
+                        BEGIN
+                            IF NOT EXISTS (
+                                SELECT 1 FROM information_schema.columns
+                                WHERE table_schema = current_schema()
+                                  AND table_name = 'users' AND column_name = 'total_count'
+                            ) THEN
+                                ALTER TABLE users ADD COLUMN total_count INTEGER NOT NULL DEFAULT 0;
+                                
+                                INSERT INTO users (user_id, total_count)
+                                SELECT user_id, COUNT(*) FROM habit_entries GROUP BY user_id
+                                ON CONFLICT (user_id)
+                                DO UPDATE SET total_count = EXCLUDED.total_count;
+                            END IF;
+                        END $$;
+                        
+                        -- Likewise for the denormalized last entry date
+                        DO $$
+                        BEGIN
+                            IF NOT EXISTS (
+                                SELECT 1 FROM information_schema.columns
+                                WHERE table_schema = current_schema()
+                                  AND table_name = 'users' AND column_name = 'last_entry_date'
+                            ) THEN
+                                ALTER TABLE users ADD COLUMN last_entry_date DATE;
+                                
+                                UPDATE users u
+                                SET last_entry_date = m.last_entry_date
+                                FROM (
+                                    SELECT user_id, MAX(entry_date) AS last_entry_date
+                                    FROM habit_entries
+                                    GROUP BY user_id
+                                ) m
+                                WHERE u.user_id = m.user_id;
+                            END IF;
+                        END $$;
+                        
+                        -- Matches the ORDER BY of the latest-entry lookups, so they
+                        -- are served by one index seek with no sort
+                        CREATE INDEX IF NOT EXISTS idx_habit_entries_user_date_created_desc 
+                        ON habit_entries(user_id, entry_date DESC, created_at DESC);
+                        
+                        DROP INDEX IF EXISTS idx_habit_entries_user_date;
                         
                         CREATE INDEX IF NOT EXISTS idx_users_user_id 
                         ON users(user_id);
                     """)
-                    self.connection.commit()
+                    cursor.execute("COMMENT ON TABLE habit_entries IS %s", (SCHEMA_VERSION,))
+                    conn.commit()
                     self.logger.info("Database tables created successfully")
         except Exception as e:
             self.logger.error(f"Failed to create tables: {e}")
             raise
     
     def add_entry(self, user_id, notes=None):
-        """Add a new habit entry for today"""
+        """Add a new habit entry for today and return the user's updated stats"""
         try:
-            self._ensure_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO habit_entries (user_id, notes) 
-                    VALUES (%s, %s)
-                    RETURNING id, entry_date, created_at
-                """, (user_id, notes))
+            with self._conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+                cursor.execute("EXECUTE habit_add_entry(%s, %s)", (user_id, notes))
                 
                 result = cursor.fetchone()
-                self.connection.commit()
+                conn.commit()
                 
                 self.logger.info(f"Added habit entry for user {user_id}")
-                return result
+                if not result:
+                    return None
+                
+                return {
+                    'last_entry': {
+                        'entry_date': result[0],
+                        'notes': notes
+                    },
+                    'total_count': int(result[1]),
+                    'days_since_last': (date.today() - result[0]).days
+                }
         except Exception as e:
             self.logger.error(f"Failed to add entry: {e}")
-            try:
-                if self.connection and not self.connection.closed:
-                    self.connection.rollback()
-            except:
-                pass
+            raise
+    
+    def add_entries(self, rows):
+        """Insert many (user_id, notes) habit entries in batched round trips"""
+        try:
+            with self._conn() as conn, conn.cursor() as cursor:
+                inserted = execute_values(cursor, """
+                    INSERT INTO habit_entries (user_id, notes) 
+                    VALUES %s
+                    RETURNING user_id, entry_date, created_at
+                """, rows, page_size=INSERT_PAGE_SIZE, fetch=True)
+                
+                # Keep the rolling per-user counts and dates in the same transaction
+                counts = Counter(row['user_id'] for row in inserted)
+                last_dates = {}
+                for row in inserted:
+                    last_date = last_dates.get(row['user_id'])
+                    if last_date is None or row['entry_date'] > last_date:
+                        last_dates[row['user_id']] = row['entry_date']
+                execute_values(cursor, """
+                    INSERT INTO users (user_id, total_count, last_entry_date) 
+                    VALUES %s
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET 
+                        total_count = users.total_count + EXCLUDED.total_count,
+                        last_entry_date = GREATEST(users.last_entry_date, EXCLUDED.last_entry_date),
+                        updated_at = CURRENT_TIMESTAMP
+                """, [(user_id, count, last_dates[user_id]) for user_id, count in counts.items()],
+                    page_size=INSERT_PAGE_SIZE)
+                conn.commit()
+                
+                self.logger.info(f"Added {len(inserted)} habit entries")
+                return inserted
+        except Exception as e:
+            self.logger.error(f"Failed to add entries: {e}")
             raise
     
     def get_last_entry(self, user_id):
         """Get the most recent habit entry for a user"""
         try:
-            self._ensure_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT entry_date, created_at, notes
-                    FROM habit_entries 
-                    WHERE user_id = %s 
-                    ORDER BY entry_date DESC, created_at DESC 
-                    LIMIT 1
-                """, (user_id,))
+            with self._conn() as conn, conn.cursor() as cursor:
+                cursor.execute("EXECUTE habit_last_entry(%s)", (user_id,))
                 
                 return cursor.fetchone()
         except Exception as e:
@@ -128,16 +376,11 @@ class HabitTracker:
     def get_total_count(self, user_id):
         """Get total number of habit entries for a user"""
         try:
-            self._ensure_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT COUNT(*) as total_count
-                    FROM habit_entries 
-                    WHERE user_id = %s
-                """, (user_id,))
+            with self._conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+                cursor.execute("EXECUTE habit_total_count(%s)", (user_id,))
                 
                 result = cursor.fetchone()
-                return int(result['total_count']) if result else 0
+                return int(result[0]) if result else 0
         except Exception as e:
             self.logger.error(f"Failed to get total count: {e}")
             return 0
@@ -145,15 +388,11 @@ class HabitTracker:
     def get_days_since_last(self, user_id):
         """Get number of days since last habit entry"""
         try:
-            last_entry = self.get_last_entry(user_id)
-            if not last_entry:
-                return None
-            
-            last_date = last_entry['entry_date']
-            today = date.today()
-            
-            days_diff = (today - last_date).days
-            return days_diff
+            with self._conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+                cursor.execute("EXECUTE habit_days_since_last(%s)", (user_id,))
+                
+                result = cursor.fetchone()
+                return result[0] if result else None
         except Exception as e:
             self.logger.error(f"Failed to calculate days since last: {e}")
             return None
@@ -161,69 +400,89 @@ class HabitTracker:
     def get_user_stats(self, user_id):
         """Get comprehensive stats for a user"""
         try:
-            last_entry = self.get_last_entry(user_id)
-            total_count = self.get_total_count(user_id)
-            days_since = self.get_days_since_last(user_id)
+            with self._conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+                cursor.execute("EXECUTE habit_user_stats(%s)", (user_id,))
+                
+                result = cursor.fetchone()
+            
+            if not result or result[1] is None:
+                return {
+                    'last_entry': None,
+                    'total_count': int(result[0]) if result else 0,
+                    'days_since_last': None
+                }
             
             return {
-                'last_entry': last_entry,
-                'total_count': total_count,
-                'days_since_last': days_since
+                'last_entry': {
+                    'entry_date': result[1]
+                },
+                'total_count': int(result[0]),
+                'days_since_last': result[2]
             }
         except Exception as e:
             self.logger.error(f"Failed to get user stats: {e}")
             return None
     
     def get_user_language(self, user_id):
-        """Get user's language preference"""
+        """Get user's language preference, or None if the lookup failed"""
+        cached = self._lang_cache.get(user_id)
+        if cached and time.monotonic() - cached[1] < LANGUAGE_CACHE_TTL:
+            return cached[0]
+        
         try:
-            self._ensure_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT language FROM users WHERE user_id = %s
-                """, (user_id,))
+            with self._conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+                # Unknown users are created with the default language in the same statement
+                cursor.execute("EXECUTE habit_get_language(%s)", (user_id,))
                 
                 result = cursor.fetchone()
-                if result:
-                    return result['language']
-                else:
-                    # Create new user with default language
-                    return self.set_user_language(user_id, 'english')
+                conn.commit()
+            
+            language = result[0] if result else 'english'
+            self._remember_language(user_id, language)
+            return language
         except Exception as e:
             self.logger.error(f"Failed to get user language: {e}")
-            return 'english'  # Default fallback
+            return None  # Callers fall back without caching the failure
     
     def set_user_language(self, user_id, language):
         """Set user's language preference"""
         try:
-            self._ensure_connection()
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO users (user_id, language) 
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id) 
-                    DO UPDATE SET 
-                        language = EXCLUDED.language,
-                        updated_at = CURRENT_TIMESTAMP
-                    RETURNING language
-                """, (user_id, language))
+            with self._conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+                cursor.execute("EXECUTE habit_set_language(%s, %s)", (user_id, language))
                 
                 result = cursor.fetchone()
-                self.connection.commit()
+                conn.commit()
                 
                 self.logger.info(f"Set language for user {user_id} to {language}")
-                return result['language'] if result else language
+                language = result[0] if result else language
+                self._remember_language(user_id, language)
+                return language
         except Exception as e:
             self.logger.error(f"Failed to set user language: {e}")
-            try:
-                if self.connection and not self.connection.closed:
-                    self.connection.rollback()
-            except:
-                pass
             return language  # Return requested language as fallback
     
+    def claim_daily_run(self, run_date, chat_id):
+        """Claim the daily message for run_date and chat; False if another process already has"""
+        try:
+            with self._conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cursor:
+                cursor.execute("EXECUTE habit_claim_daily_run(%s, %s)", (run_date, str(chat_id)))
+                
+                claimed = cursor.fetchone() is not None
+                conn.commit()
+                return claimed
+        except Exception as e:
+            # Sending twice beats not sending at all
+            self.logger.error(f"Failed to claim daily run: {e}")
+            return True
+    
+    def _remember_language(self, user_id, language):
+        """Cache a user's language for LANGUAGE_CACHE_TTL seconds"""
+        if len(self._lang_cache) >= LANGUAGE_CACHE_MAX:
+            self._lang_cache.clear()
+        self._lang_cache[user_id] = (language, time.monotonic())
+    
     def close(self):
-        """Close database connection"""
-        if self.connection:
-            self.connection.close()
+        """Close all pooled database connections"""
+        if self.pool:
+            self.pool.closeall()
             self.logger.info("Database connection closed")
\ No newline at end of file
@@ -2,12 +2,24 @@
 Message scheduling functionality
 """
 
-import schedule
+import random
 import time
 import logging
 import threading
-from datetime import datetime, timedelta
-import pytz
+import functools
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+RUN_TIME_FORMAT = "%Y-%m-%d %H:%M:%S %Z"
+MAX_RETRY_DELAY = 300
+
+@functools.lru_cache(maxsize=32)
+def _tz(name):
+    """Return the cached tzinfo for a timezone name"""
+    # UTC must work even on hosts without tz data, as the fallback zone
+    if name == 'UTC':
+        return timezone.utc
+    return ZoneInfo(name)
 
 class MessageScheduler:
     def __init__(self, bot, config):
@@ -15,18 +27,17 @@ class MessageScheduler:
         self.config = config
         self.logger = logging.getLogger(__name__)
         self.running = False
-        self.scheduler_thread = None
+        self._timer = None
+        self._timer_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._next_run = None
         
         self._setup_schedule()
     
     def _setup_schedule(self):
         """Setup the daily message schedule"""
         try:
-            # Clear existing schedules
-            schedule.clear()
-            
-            # Schedule daily message
-            schedule.every().day.at(self.config.schedule_time).do(self._send_scheduled_message)
+            self._next_run = self._compute_next_run()
             
             self.logger.info(f"Daily message scheduled for {self.config.schedule_time} ({self.config.timezone})")
             
@@ -34,10 +45,18 @@ class MessageScheduler:
             self.logger.error(f"Failed to setup schedule: {e}")
             raise
     
-    def _send_scheduled_message(self):
-        """Send scheduled message with retry logic"""
+    def _send_scheduled_message(self, run_date):
+        """Send the message scheduled for run_date, with retry logic"""
+        # With several bot processes on one database, only the first to claim
+        # the scheduled run for this chat sends it
+        habit_tracker = getattr(self.bot, 'habit_tracker', None)
+        if habit_tracker and not habit_tracker.claim_daily_run(run_date, getattr(self.bot, 'chat_id', self.config.chat_id)):
+            self.logger.info("Daily message already sent by another process")
+            return
+        
         attempt = 1
         max_attempts = self.config.retry_attempts
+        delay = self.config.retry_delay
         
         while attempt <= max_attempts:
             try:
@@ -50,8 +69,12 @@ class MessageScheduler:
                 self.logger.error(f"Attempt {attempt} failed: {e}")
                 
                 if attempt < max_attempts:
-                    self.logger.info(f"Retrying in {self.config.retry_delay} seconds...")
-                    time.sleep(self.config.retry_delay)
+                    wait = delay + random.uniform(0, delay * 0.1)
+                    self.logger.info(f"Retrying in {wait:.1f} seconds...")
+                    if self._stop.wait(wait):
+                        self.logger.info("Scheduler stopping, retries abandoned")
+                        return
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
                 else:
                     self.logger.error("All retry attempts failed")
                     # Send failure notification
@@ -64,20 +87,20 @@ class MessageScheduler:
                 attempt += 1
     
     def start(self):
-        """Start the scheduler in a separate thread"""
+        """Start the scheduler by arming a timer for the next run"""
         if self.running:
             self.logger.warning("Scheduler is already running")
             return
         
         self.running = True
-        self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
-        self.scheduler_thread.start()
+        self._stop.clear()
+        self._arm()
         
         self.logger.info("Message scheduler started")
         
         # Send startup notification
         try:
-            startup_msg = f"🤖 Daily Message Bot started!\n\n📅 Next message scheduled for: {self.get_next_run_time(self.config.schedule_time)}"
+            startup_msg = f"🤖 Daily Message Bot started!\n\n📅 Next message scheduled for: {self._next_run.strftime(RUN_TIME_FORMAT)}"
             self.bot.send_message(startup_msg)
         except Exception as e:
             self.logger.error(f"Failed to send startup notification: {e}")
@@ -85,44 +108,72 @@ class MessageScheduler:
     def stop(self):
         """Stop the scheduler"""
         self.running = False
-        if self.scheduler_thread:
-            self.scheduler_thread.join(timeout=5)
+        self._stop.set()
+        self._arm()
         
-        schedule.clear()
         self.logger.info("Message scheduler stopped")
     
-    def _run_scheduler(self):
-        """Run the scheduler loop"""
-        while self.running:
-            try:
-                schedule.run_pending()
-                time.sleep(30)  # Check every 30 seconds
-            except Exception as e:
-                self.logger.error(f"Scheduler error: {e}")
-                time.sleep(60)  # Wait longer on error
+    def _arm(self):
+        """Replace any pending timer with one firing at the next run, unless stopped"""
+        with self._timer_lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self.running:
+                return
+            
+            # Absolute time: same-zone datetime subtraction ignores DST offset changes
+            delay = self._next_run.timestamp() - time.time()
+            self._timer = threading.Timer(max(delay, 0), self._run_due)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def _run_due(self):
+        """Send the due message, then arm the timer for the following run"""
+        fired = self._next_run
+        try:
+            self._send_scheduled_message(fired.date())
+        except Exception as e:
+            self.logger.error(f"Scheduler error: {e}")
+        
+        # A timer firing a moment early must not schedule the same run again
+        next_run = self._compute_next_run()
+        if next_run.timestamp() <= fired.timestamp():
+            next_run = fired + timedelta(days=1)
+        self._next_run = next_run
+        self._arm()
+    
+    def _compute_next_run(self):
+        """Get the next run as an aware datetime in the configured timezone"""
+        try:
+            return self._next_run_after(self.config.schedule_time, self.config.timezone)
+        except Exception as e:
+            self.logger.warning(f"Invalid timezone {self.config.timezone!r}, using UTC: {e}")
+            return self._next_run_after(self.config.schedule_time, 'UTC')
+    
+    @staticmethod
+    def _next_run_after(schedule_time, timezone_str):
+        """Get the next datetime at schedule_time in the given timezone"""
+        # Parse schedule time
+        hour, minute = map(int, schedule_time.split(':'))
+        
+        # Get current time in specified timezone
+        now = datetime.now(_tz(timezone_str))
+        
+        # Create next scheduled time
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        
+        # If the time has already passed today, schedule for tomorrow
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        
+        return next_run
     
     @staticmethod
     def get_next_run_time(schedule_time, timezone_str='UTC'):
         """Get the next scheduled run time"""
         try:
-            # Parse schedule time
-            hour, minute = map(int, schedule_time.split(':'))
-            
-            # Get timezone
-            tz = pytz.timezone(timezone_str) if timezone_str != 'UTC' else pytz.UTC
-            
-            # Get current time in specified timezone
-            now = datetime.now(tz)
-            
-            # Create next scheduled time
-            next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            
-            # If the time has already passed today, schedule for tomorrow
-            if next_run <= now:
-                next_run += timedelta(days=1)
-            
-            return next_run.strftime("%Y-%m-%d %H:%M:%S %Z")
-            
+            return MessageScheduler._next_run_after(schedule_time, timezone_str).strftime(RUN_TIME_FORMAT)
         except Exception as e:
             return f"Error calculating next run time: {e}"
     
@@ -131,6 +182,7 @@ class MessageScheduler:
         try:
             self.config.schedule_time = new_time
             self._setup_schedule()
+            self._arm()
             self.logger.info(f"Rescheduled daily message to {new_time}")
             return True
         except Exception as e:
@@ -139,10 +191,9 @@ class MessageScheduler:
     
     def get_status(self):
         """Get scheduler status information"""
-        jobs = schedule.jobs
         status = {
             'running': self.running,
-            'scheduled_jobs': len(jobs),
-            'next_run': self.get_next_run_time(self.config.schedule_time, self.config.timezone) if jobs else "No jobs scheduled"
+            'scheduled_jobs': 1 if self._next_run else 0,
+            'next_run': self._next_run.strftime(RUN_TIME_FORMAT) if self._next_run else "No jobs scheduled"
         }
         return status
@@ -0,0 +1,68 @@
+"""
+Shared JSON and file-writing helpers
+"""
+
+import json
+import os
+import shutil
+
+# orjson is optional; fall back to the stdlib json module when it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(payload):
+    """Parse JSON from bytes"""
+    if orjson:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def json_dumps(data):
+    """Serialize data as indented JSON bytes"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode('utf-8')
+
+def json_line(obj):
+    """Serialize obj as a single line of JSON bytes"""
+    if orjson:
+        return orjson.dumps(obj) + b'\n'
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8') + b'\n'
+
+def atomic_write(path, payload, mode=0o644):
+    """Replace path with payload (bytes) in one write, keeping an existing file's mode and owner"""
+    tmp_path = path + '.tmp'
+    exists = os.path.exists(path)
+    try:
+        # Replacements start private until the original's mode is copied over;
+        # new files get the requested mode, narrowed by the umask as open() would
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 if exists else mode)
+        try:
+            # A regular file normally takes the whole payload in one write; only
+            # a short write needs a view over the remainder
+            written = os.write(fd, payload)
+            if written < len(payload):
+                view = memoryview(payload)[written:]
+                while view:
+                    view = view[os.write(fd, view):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        if exists:
+            shutil.copymode(path, tmp_path)
+            if hasattr(os, 'chown'):
+                st = os.stat(path)
+                try:
+                    os.chown(tmp_path, st.st_uid, st.st_gid)
+                except OSError:
+                    pass
+        
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise